@@ -0,0 +1,225 @@
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import re
+import shutil
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+import boto3
+import logging
+
+# Initialize logger
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Profiling is opt-in per deployment/run:
+#   PROFILING_ENABLED=true              capture cProfile + tracemalloc for the run and per step
+#   PROFILING_S3_PREFIX=s3://bucket/key upload the artifacts after the run
+#   PROFILING_TOP_N=25                  rows kept in the text summaries
+#   PROFILING_MAX_STEPS=200             steps reported per run, the rest only count towards the run profile
+#   PROFILING_KEEP_RUNS=5               run directories kept in /tmp, including the current one
+# With the flag off every hook is a no-op and nothing is traced.
+# Artifacts live in /tmp, which Lambda shares across warm invocations (512 MB by default),
+# so the run directory is removed once it has been uploaded and older runs are pruned on start.
+class Profiler:
+    base_dir = os.path.join('/tmp', 'profiles')
+
+    def __init__(self, request_id=None):
+        self.enabled = os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+        if not self.enabled:
+            return
+        self.top_n = self._int_setting('PROFILING_TOP_N', 25)
+        self.max_steps = self._int_setting('PROFILING_MAX_STEPS', 200)
+        self.keep_runs = max(self._int_setting('PROFILING_KEEP_RUNS', 5), 1)
+        self.s3_prefix = os.environ.get('PROFILING_S3_PREFIX', '')
+        self.artifacts = []
+        self.step_count = 0
+        self.max_peak = 0
+        self._run_profile = None
+        self._last_snapshot = None
+        self._started_tracemalloc = False
+        run_id = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S') + '_' + self._safe_name(request_id or 'local')
+        self.output_dir = os.path.join(self.base_dir, run_id)
+        try:
+            self._prune_old_runs()
+            os.makedirs(self.output_dir, exist_ok=True)
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+        except Exception as e:
+            logger.error("Failed to set up profiling, continuing without it: %s", str(e))
+            self.enabled = False
+            return
+        logger.info("Profiling enabled, writing artifacts to %s", self.output_dir)
+
+    def invocation(self):
+        if not self.enabled:
+            return nullcontext()
+        return self._profile_invocation()
+
+    def step(self, name):
+        if not self.enabled:
+            return nullcontext()
+        if self.step_count >= self.max_steps:
+            if self.step_count == self.max_steps:
+                logger.info("Reached PROFILING_MAX_STEPS=%d, remaining steps only count towards the run profile", self.max_steps)
+            self.step_count += 1
+            return nullcontext()
+        self.step_count += 1
+        return self._profile_step(name)
+
+    @contextmanager
+    def _profile_invocation(self):
+        self._run_profile = cProfile.Profile()
+        snapshot_before = self._take_snapshot()
+        self._reset_peak()
+        start = time.perf_counter()
+        self._run_profile.enable()
+        try:
+            yield
+        finally:
+            self._run_profile.disable()
+            elapsed = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            self.max_peak = max(self.max_peak, peak)
+            try:
+                snapshot_after = self._take_snapshot()
+                self._write_artifacts('invocation', pstats.Stats(self._run_profile), elapsed, current, self.max_peak, snapshot_before, snapshot_after)
+                logger.info("Invocation profile written, %.3f s, peak traced memory: %.1f KiB", elapsed, self.max_peak / 1024)
+            except Exception as e:
+                logger.error("Failed to write invocation profile: %s", str(e))
+            self._run_profile = None
+            self._last_snapshot = None
+            self.finish()
+
+    @contextmanager
+    def _profile_step(self, name):
+        file_name = self._safe_name(name)
+        # Pausing the run profile would cut its call tree, so inside an invocation steps are
+        # time/memory markers and only standalone steps get their own cProfile
+        profile = None if self._run_profile else cProfile.Profile()
+        # The previous step's end snapshot doubles as this step's start, one snapshot per step
+        snapshot_before = self._last_snapshot or self._take_snapshot()
+        self._last_snapshot = None
+        self._reset_peak()
+        start = time.perf_counter()
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+            elapsed = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            self.max_peak = max(self.max_peak, peak)
+            try:
+                snapshot_after = self._take_snapshot()
+                self._last_snapshot = snapshot_after
+                stats = pstats.Stats(profile) if profile else None
+                self._write_artifacts(file_name, stats, elapsed, current, peak, snapshot_before, snapshot_after)
+                logger.info("Profile for step %s written, %.3f s, peak traced memory: %.1f KiB", file_name, elapsed, peak / 1024)
+            except Exception as e:
+                # Never let diagnostics break order processing
+                logger.error("Failed to write profile for step %s: %s", name, str(e))
+
+    def _write_artifacts(self, file_name, stats, elapsed, current, peak, snapshot_before, snapshot_after):
+        lines = [
+            "Wall time: %.3f s" % elapsed,
+            "Peak traced memory: %.1f KiB" % (peak / 1024),
+            "Traced memory at end: %.1f KiB" % (current / 1024),
+            "",
+            "Top allocations (net change since start):",
+        ]
+        for stat in snapshot_after.compare_to(snapshot_before, 'lineno')[:self.top_n]:
+            lines.append(str(stat))
+
+        if stats:
+            prof_path = os.path.join(self.output_dir, file_name + '.prof')
+            stats.dump_stats(prof_path)
+            self.artifacts.append(prof_path)
+            stats_stream = io.StringIO()
+            stats.stream = stats_stream
+            stats.sort_stats('cumulative').print_stats(self.top_n)
+            lines.extend(["", "cProfile (cumulative):", stats_stream.getvalue()])
+        else:
+            lines.extend(["", "cProfile: see invocation.prof"])
+
+        txt_path = os.path.join(self.output_dir, file_name + '.txt')
+        with open(txt_path, 'w') as summary_file:
+            summary_file.write("\n".join(lines))
+        self.artifacts.append(txt_path)
+
+    def finish(self):
+        if not self.enabled:
+            return
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        if self.s3_prefix and self._upload_artifacts():
+            shutil.rmtree(self.output_dir, ignore_errors=True)
+            logger.info("Removed uploaded profile artifacts from %s", self.output_dir)
+
+    def _upload_artifacts(self):
+        match = re.match(r'^s3://([^/]+)/?(.*)$', self.s3_prefix)
+        if not match:
+            logger.error("Invalid PROFILING_S3_PREFIX: %s", self.s3_prefix)
+            return False
+        bucket, prefix = match.group(1), match.group(2).strip('/')
+        run_id = os.path.basename(self.output_dir)
+        try:
+            s3_client = boto3.client('s3')
+        except Exception as e:
+            logger.error("Failed to create S3 client for profile upload: %s", str(e))
+            return False
+        all_success = True
+        for path in self.artifacts:
+            key = '/'.join(part for part in (prefix, run_id, os.path.basename(path)) if part)
+            try:
+                s3_client.upload_file(path, bucket, key)
+                logger.info("Uploaded profile artifact to s3://%s/%s", bucket, key)
+            except Exception as e:
+                logger.error("Failed to upload profile artifact %s: %s", path, str(e))
+                all_success = False
+        return all_success
+
+    def _prune_old_runs(self):
+        if not os.path.isdir(self.base_dir):
+            return
+        runs = [os.path.join(self.base_dir, name) for name in os.listdir(self.base_dir)]
+        runs = sorted((path for path in runs if os.path.isdir(path)), key=os.path.getmtime)
+        # Leave room for the run that is about to start
+        for path in runs[:max(len(runs) - (self.keep_runs - 1), 0)]:
+            shutil.rmtree(path, ignore_errors=True)
+            logger.info("Removed old profile artifacts from %s", path)
+
+    def _take_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, contextlib.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+
+    def _reset_peak(self):
+        _, peak = tracemalloc.get_traced_memory()
+        self.max_peak = max(self.max_peak, peak)
+        tracemalloc.reset_peak()
+
+    @staticmethod
+    def _int_setting(name, default):
+        value = os.environ.get(name, '')
+        if not value:
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            logger.warning("Invalid %s=%s, using %d", name, value, default)
+            return default
+
+    @staticmethod
+    def _safe_name(name):
+        return re.sub(r'[^A-Za-z0-9_.-]', '_', str(name))
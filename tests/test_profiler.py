@@ -0,0 +1,289 @@
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import nullcontext
+
+import pytest
+
+import lambda_function
+import profiler as profiler_module
+from profiler import Profiler
+
+
+@pytest.fixture(autouse=True)
+def profiler_env(monkeypatch, tmp_path):
+    for name in ('PROFILING_ENABLED', 'PROFILING_S3_PREFIX', 'PROFILING_TOP_N', 'PROFILING_MAX_STEPS', 'PROFILING_KEEP_RUNS'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(Profiler, 'base_dir', str(tmp_path))
+    yield
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+class RecordingS3Client:
+    def __init__(self):
+        self.keys = []
+
+    def upload_file(self, path, bucket, key):
+        self.keys.append(key)
+
+
+class FailingS3Client:
+    def upload_file(self, path, bucket, key):
+        raise RuntimeError("access denied")
+
+
+class FakeDynamoClient:
+    def __init__(self):
+        self.status_updates = []
+
+    def scan_orders_with_failed_statuses(self, start_date, statuses):
+        return [{'order_id': 'a/b', 'order_status': 'email_sent_and_update_esim_ref_failed'}]
+
+    def get_esim_details_from_db_using_order_ref_id(self, order_id):
+        return {'esim_details': [{'iccid': '123'}], 'shopify_order_id': 1001}
+
+    def update_order_status(self, order_id, status):
+        self.status_updates.append((order_id, status))
+
+
+class FakeEsimGoClient:
+    def update_esim(self, esim_details, customer_ref):
+        raise RuntimeError("esim-go unavailable")
+
+
+class FakeEmailClient:
+    pass
+
+
+def work():
+    time.sleep(0.01)
+    return [bytes(1000) for _ in range(100)]
+
+
+def process(profiler):
+    for index in range(3):
+        with profiler.step('step_%d' % index):
+            work()
+
+
+def handler(profiler):
+    with profiler.invocation():
+        process(profiler)
+
+
+def find_stat(stats, function_name):
+    for key, value in stats.items():
+        if key[2] == function_name and key[0] == __file__:
+            return key, value
+    raise AssertionError(function_name + " not found in profile")
+
+
+@pytest.fixture
+def fake_clients(monkeypatch):
+    dynamo_client = FakeDynamoClient()
+    monkeypatch.setattr(lambda_function, 'DynamoClient', lambda: dynamo_client)
+    monkeypatch.setattr(lambda_function, 'EsimGoClient', FakeEsimGoClient)
+    monkeypatch.setattr(lambda_function, 'EmailClient', FakeEmailClient)
+    return dynamo_client
+
+
+def test_disabled_profiler_is_a_no_op(tmp_path):
+    profiler = Profiler('request-1')
+
+    assert isinstance(profiler.step('scan_orders'), nullcontext)
+    assert isinstance(profiler.invocation(), nullcontext)
+    with profiler.invocation():
+        with profiler.step('scan_orders'):
+            pass
+    assert not tracemalloc.is_tracing()
+    assert os.listdir(tmp_path) == []
+
+
+def test_enabled_profiler_writes_step_and_invocation_artifacts(monkeypatch):
+    monkeypatch.setenv('PROFILING_ENABLED', 'true')
+    profiler = Profiler('request-1')
+
+    handler(profiler)
+
+    files = sorted(os.listdir(profiler.output_dir))
+    assert files == ['invocation.prof', 'invocation.txt', 'step_0.txt', 'step_1.txt', 'step_2.txt']
+    with open(os.path.join(profiler.output_dir, 'step_0.txt')) as summary_file:
+        summary = summary_file.read()
+    assert "Peak traced memory" in summary
+    assert "Top allocations (net change since start):" in summary
+    assert profiler_module.__file__ + ":" not in summary
+    assert not tracemalloc.is_tracing()
+
+
+def test_invocation_profile_keeps_call_tree(monkeypatch):
+    monkeypatch.setenv('PROFILING_ENABLED', 'true')
+    profiler = Profiler('request-1')
+
+    handler(profiler)
+
+    stats = pstats.Stats(os.path.join(profiler.output_dir, 'invocation.prof')).stats
+    process_key, (_, process_calls, _, process_cumtime, _) = find_stat(stats, 'process')
+    _, (_, work_calls, _, work_cumtime, work_callers) = find_stat(stats, 'work')
+    assert process_calls == 1
+    assert work_calls == 3
+    assert process_key in work_callers
+    assert process_cumtime >= work_cumtime >= 0.03
+
+
+def test_standalone_step_writes_its_own_profile(monkeypatch):
+    monkeypatch.setenv('PROFILING_ENABLED', 'true')
+    profiler = Profiler('request-1')
+
+    with profiler.step('scan_orders'):
+        work()
+    profiler.finish()
+
+    stats = pstats.Stats(os.path.join(profiler.output_dir, 'scan_orders.prof')).stats
+    _, (_, work_calls, _, _, _) = find_stat(stats, 'work')
+    assert work_calls == 1
+
+
+def test_invalid_top_n_falls_back_to_default(monkeypatch):
+    monkeypatch.setenv('PROFILING_ENABLED', 'true')
+    monkeypatch.setenv('PROFILING_TOP_N', 'abc')
+
+    profiler = Profiler('request-1')
+    profiler.finish()
+
+    assert profiler.enabled
+    assert profiler.top_n == 25
+
+
+def test_max_steps_caps_step_artifacts(monkeypatch, caplog):
+    monkeypatch.setenv('PROFILING_ENABLED', 'true')
+    monkeypatch.setenv('PROFILING_MAX_STEPS', '2')
+    profiler = Profiler('request-1')
+
+    with caplog.at_level(logging.INFO):
+        with profiler.invocation():
+            for index in range(4):
+                with profiler.step('order_%d' % index):
+                    work()
+
+    files = sorted(os.listdir(profiler.output_dir))
+    assert files == ['invocation.prof', 'invocation.txt', 'order_0.txt', 'order_1.txt']
+    assert caplog.text.count("Reached PROFILING_MAX_STEPS=2") == 1
+    stats = pstats.Stats(os.path.join(profiler.output_dir, 'invocation.prof')).stats
+    _, (_, work_calls, _, _, _) = find_stat(stats, 'work')
+    assert work_calls == 4
+
+
+def test_invalid_max_steps_falls_back_to_default(monkeypatch, caplog):
+    monkeypatch.setenv('PROFILING_ENABLED', 'true')
+    monkeypatch.setenv('PROFILING_MAX_STEPS', 'many')
+
+    with caplog.at_level(logging.WARNING):
+        profiler = Profiler('request-1')
+    profiler.finish()
+
+    assert profiler.max_steps == 200
+    assert "Invalid PROFILING_MAX_STEPS=many" in caplog.text
+
+
+def test_old_runs_are_pruned(monkeypatch, tmp_path):
+    monkeypatch.setenv('PROFILING_ENABLED', 'true')
+    monkeypatch.setenv('PROFILING_KEEP_RUNS', '3')
+    for index in range(5):
+        old_run = tmp_path / ('old_run_%d' % index)
+        old_run.mkdir()
+        (old_run / 'invocation.txt').write_text("old")
+        os.utime(old_run, (1000 + index, 1000 + index))
+
+    profiler = Profiler('request-1')
+    profiler.finish()
+
+    assert sorted(os.listdir(tmp_path)) == sorted(['old_run_3', 'old_run_4', os.path.basename(profiler.output_dir)])
+
+
+def test_setup_failure_disables_profiling(monkeypatch):
+    monkeypatch.setenv('PROFILING_ENABLED', 'true')
+    monkeypatch.setattr(Profiler, 'base_dir', '/proc/profiles')
+
+    profiler = Profiler('request-1')
+
+    assert not profiler.enabled
+    assert isinstance(profiler.invocation(), nullcontext)
+    assert not tracemalloc.is_tracing()
+
+
+def test_successful_upload_removes_run_directory(monkeypatch):
+    monkeypatch.setenv('PROFILING_ENABLED', 'true')
+    monkeypatch.setenv('PROFILING_S3_PREFIX', 's3://bucket/profiles/')
+    s3_client = RecordingS3Client()
+    monkeypatch.setattr(profiler_module.boto3, 'client', lambda service: s3_client)
+    profiler = Profiler('request-1')
+
+    with profiler.invocation():
+        with profiler.step('scan_orders'):
+            pass
+
+    run_id = os.path.basename(profiler.output_dir)
+    assert sorted(s3_client.keys) == [
+        'profiles/' + run_id + '/invocation.prof', 'profiles/' + run_id + '/invocation.txt',
+        'profiles/' + run_id + '/scan_orders.txt',
+    ]
+    assert not os.path.exists(profiler.output_dir)
+
+
+def test_failed_upload_is_logged_and_artifacts_kept(monkeypatch, caplog):
+    monkeypatch.setenv('PROFILING_ENABLED', 'true')
+    monkeypatch.setenv('PROFILING_S3_PREFIX', 's3://bucket/profiles')
+    monkeypatch.setattr(profiler_module.boto3, 'client', lambda service: FailingS3Client())
+    profiler = Profiler('request-1')
+
+    with caplog.at_level(logging.ERROR):
+        with profiler.invocation():
+            pass
+
+    assert "Failed to upload profile artifact" in caplog.text
+    assert os.path.isdir(profiler.output_dir)
+
+
+def test_malformed_s3_prefix_is_logged(monkeypatch, caplog):
+    monkeypatch.setenv('PROFILING_ENABLED', 'true')
+    monkeypatch.setenv('PROFILING_S3_PREFIX', 'bucket/profiles')
+    profiler = Profiler('request-1')
+
+    with caplog.at_level(logging.ERROR):
+        with profiler.invocation():
+            pass
+
+    assert "Invalid PROFILING_S3_PREFIX" in caplog.text
+
+
+def test_lambda_handler_without_profiling(fake_clients, tmp_path, caplog):
+    with caplog.at_level(logging.ERROR):
+        result = lambda_function.lambda_handler({}, None)
+
+    assert result == {'statusCode': 200, 'body': 'Processing completed'}
+    assert "Error processing order a/b: esim-go unavailable" in caplog.text
+    assert fake_clients.status_updates == [('a/b', 'email_sent_and_update_esim_ref_failed')]
+    assert os.listdir(tmp_path) == []
+    assert not tracemalloc.is_tracing()
+
+
+def test_lambda_handler_with_profiling(monkeypatch, fake_clients):
+    monkeypatch.setenv('PROFILING_ENABLED', 'true')
+
+    class Context:
+        aws_request_id = 'request-1'
+
+    result = lambda_function.lambda_handler({}, Context())
+
+    assert result == {'statusCode': 200, 'body': 'Processing completed'}
+    assert fake_clients.status_updates == [('a/b', 'email_sent_and_update_esim_ref_failed')]
+    (run_dir,) = os.listdir(Profiler.base_dir)
+    assert run_dir.endswith('_request-1')
+    files = sorted(os.listdir(os.path.join(Profiler.base_dir, run_dir)))
+    assert files == ['invocation.prof', 'invocation.txt', 'order_0000_a_b.txt', 'scan_orders.txt']
+    stats = pstats.Stats(os.path.join(Profiler.base_dir, run_dir, 'invocation.prof')).stats
+    callers = [value[4] for key, value in stats.items() if key[2] == 'update_esim']
+    assert callers and any(caller[2] == 'process_failed_orders' for caller in callers[0])